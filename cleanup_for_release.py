@@ -8,6 +8,37 @@ import os
 import shutil
 from pathlib import Path
 
+def _sweep(path, extensions, core_files, hidden=False):
+    """Remove files by extension below path and collect the remaining core files
+    
+    Hidden directories are swept too, but their contents are not listed.
+    """
+    removed_count = 0
+    
+    try:
+        entries = os.scandir(path)
+    except OSError:
+        return 0
+    
+    with entries:
+        for entry in entries:
+            # DirEntry carries the file type from the directory read, so no stat per file
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    removed_count += _sweep(entry.path, extensions, core_files,
+                                            hidden or entry.name.startswith('.'))
+            elif entry.name.endswith(extensions):
+                print(f"Removing: {entry.path}")
+                try:
+                    os.remove(entry.path)
+                    removed_count += 1
+                except Exception as e:
+                    print(f"Warning: Could not remove {entry.path}: {e}")
+            elif not hidden and not entry.name.startswith('.') and entry.name != 'cleanup_for_release.py':
+                core_files.append(os.path.relpath(entry.path, '.'))
+    
+    return removed_count
+
 def clean_project():
     """Remove personal information from project"""
     
@@ -36,8 +67,8 @@ def clean_project():
         '.env'
     ]
     
-    # Extensions to remove
-    extensions_to_remove = [
+    # Extensions to remove (a tuple, so str.endswith checks them all in one call)
+    extensions_to_remove = (
         '.vcxproj',
         '.vcxproj.filters', 
         '.sln',
@@ -49,57 +80,42 @@ def clean_project():
         '.tmp',
         '.temp',
         '.log'
-    ]
+    )
     
     removed_count = 0
     
-    # Remove folders
+    # Remove folders (just attempt it: a missing folder is the common case)
     for folder in folders_to_remove:
-        if os.path.exists(folder):
-            print(f"Removing folder: {folder}")
-            try:
-                shutil.rmtree(folder, ignore_errors=True)
-                removed_count += 1
-            except Exception as e:
-                print(f"Warning: Could not remove {folder}: {e}")
+        try:
+            shutil.rmtree(folder)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"Warning: Could not remove {folder}: {e}")
+            continue
+        print(f"Removed folder: {folder}")
+        removed_count += 1
     
     # Remove files
     for file in files_to_remove:
-        if os.path.exists(file):
-            print(f"Removing file: {file}")
-            try:
-                os.remove(file)
-                removed_count += 1
-            except Exception as e:
-                print(f"Warning: Could not remove {file}: {e}")
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"Warning: Could not remove {file}: {e}")
+            continue
+        print(f"Removed file: {file}")
+        removed_count += 1
     
-    # Remove by extension recursively
-    for root, dirs, files in os.walk('.'):
-        for file in files:
-            if any(file.endswith(ext) for ext in extensions_to_remove):
-                file_path = os.path.join(root, file)
-                print(f"Removing: {file_path}")
-                try:
-                    os.remove(file_path)
-                    removed_count += 1
-                except Exception as e:
-                    print(f"Warning: Could not remove {file_path}: {e}")
+    # Remove by extension and survey the remaining core files in a single walk
+    core_files = []
+    removed_count += _sweep('.', extensions_to_remove, core_files)
     
     print(f"\nCleanup complete! Removed {removed_count} items.")
     print("Project is now ready for public release!")
     print("\nRemaining core files:")
     
-    # Show what's left
-    core_files = []
-    for root, dirs, files in os.walk('.'):
-        # Skip hidden directories
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
-        
-        for file in files:
-            if not file.startswith('.') and file != 'cleanup_for_release.py':
-                rel_path = os.path.relpath(os.path.join(root, file), '.')
-                core_files.append(rel_path)
-    
     for file in sorted(core_files):
         print(f"  {file}")
 
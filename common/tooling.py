@@ -0,0 +1,91 @@
+"""
+Tooling shared by the forge and the delta trainer
+
+File mapping, preallocation and gathered-write limits, JSON map output, and
+the rule for when a parallel Numba kernel may be launched.
+"""
+
+import os
+import json
+import mmap
+import errno
+import threading
+from pathlib import Path
+from typing import Dict, Any
+
+try:
+    # SIMD JSON serializer, several times faster than json.dump on large maps
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+JIT_MIN_PAGES = 1024  # Below this, a kernel's thread startup outweighs the pages it covers
+
+def parallel_jit_allowed(page_count: int) -> bool:
+    """Whether a parallel Numba kernel should handle page_count pages on this thread
+    
+    Numba's TBB threading layer hangs at interpreter exit once a parallel kernel
+    has been launched off the main thread, so other threads take a serial path.
+    """
+    return page_count >= JIT_MIN_PAGES and threading.current_thread() is threading.main_thread()
+
+def map_readonly(path: Path) -> memoryview:
+    """Memory-map a file read-only for one front-to-back scan"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap cannot map an empty file
+            return memoryview(b'')
+        
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        # Aggressive readahead, and pages behind the scan can be dropped early
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return memoryview(mm)
+
+def unmap(view: memoryview) -> None:
+    """Release a view from map_readonly and close its mapping
+    
+    A mapping that still has buffers exported (say, arrays kept alive by a
+    traceback) cannot be closed yet; it is then left for the garbage collector.
+    """
+    mm = view.obj
+    try:
+        view.release()
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+    except BufferError:
+        pass
+
+def preallocate(fd: int, size: int) -> None:
+    """Reserve a file's full extent up front so it is laid out contiguously"""
+    if not hasattr(os, 'posix_fallocate'):
+        return
+    
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        # Filesystem cannot preallocate; the file is simply written unreserved
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+
+def read_json(path: Path) -> Any:
+    """Load a JSON map"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read()) if orjson is not None else json.loads(f.read())
+
+def write_json(path: Path, data: Dict[str, Any]) -> None:
+    """Write a JSON map, indented"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
@@ -10,37 +10,212 @@ Usage: python incremental_model_updater.py --base model.gguf --target updated.gg
 
 import os
 import sys
-import json
-import struct
+import mmap
+import base64
+import hashlib
 import zlib  # Use zlib for CRC32
 import argparse
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+if not __package__:
+    # Run as a script: the shared tooling lives in common/ at the repo root
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.tooling import (IOV_MAX, map_readonly, parallel_jit_allowed, preallocate, read_json,
+                            write_json)
+
+try:
+    # Page comparison compiled to native code, pages split across threads
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    # 64-bit page fingerprints hashed at close to memory bandwidth
+    from xxhash import xxh3_64_intdigest as _xxh3_64
+except ImportError:
+    _xxh3_64 = None
+
+try:
+    # CRC32C through the SSE4.2 / ARMv8 CRC32 instructions
+    from crc32c import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+if _crc32c is not None:
+    _CHECKSUM = 'crc32c'
+    
+    def _checksum(data, value: int = 0) -> int:
+        return _crc32c(data, value)
+else:
+    _CHECKSUM = 'crc32'
+    
+    def _checksum(data, value: int = 0) -> int:
+        return zlib.crc32(data, value)
+
+try:
+    # LZ4 block codec: compresses byte-grouped payloads at close to memory speed
+    import lz4.block as _lz4_block
+except ImportError:
+    _lz4_block = None
+
+# Page kernels are compiled for 4KB pages: numba freezes these globals into
+# constants, so the word loops have fixed trip counts LLVM can unroll and vectorize
+_PAGE_WORDS = 4096 // 8  # GGUFDeltaTrainer.PAGE_SIZE in uint64 words
+_WORD_BLOCK = 64  # Words OR-reduced between early-exit checks
+
+if njit is not None:
+    @njit(inline='always', boundscheck=False)
+    def _page_differs(base, target, p):
+        """Whether row p of two (pages, _PAGE_WORDS) uint64 matrices differs"""
+        for block in range(0, _PAGE_WORDS, _WORD_BLOCK):
+            # No branch inside a block, so it compiles to wide XOR/OR vectors
+            acc = np.uint64(0)
+            for i in range(block, block + _WORD_BLOCK):
+                acc |= base[p, i] ^ target[p, i]
+            if acc != 0:
+                return True
+        return False
+    
+    @njit(parallel=True, boundscheck=False, cache=True, nogil=True)
+    def _page_diff_mask_jit(base, target, out):
+        """Flag each differing row of two (pages, _PAGE_WORDS) uint64 matrices, rows in parallel"""
+        for p in prange(base.shape[0]):
+            out[p] = _page_differs(base, target, p)
+    
+    @njit(boundscheck=False, cache=True, nogil=True)
+    def _scan_runs_jit(base, target, starts, ends):
+        """Find the runs of differing rows of two (pages, _PAGE_WORDS) uint64 matrices in one pass
+        
+        Writes each run's [start, end) row range to starts and ends; returns the run count.
+        """
+        runs = 0
+        in_run = False
+        for p in range(base.shape[0]):
+            changed = _page_differs(base, target, p)
+            if changed and not in_run:
+                starts[runs] = p
+                in_run = True
+            elif not changed and in_run:
+                ends[runs] = p
+                runs += 1
+                in_run = False
+        if in_run:
+            ends[runs] = base.shape[0]
+            runs += 1
+        return runs
+    
+    @njit(boundscheck=False, cache=True, nogil=True)
+    def _cdc_cuts_jit(data, gear, mask, min_size, max_size, out):
+        """Write the chunk end offsets of data to out; returns how many were written"""
+        h = np.uint64(0)
+        start = 0
+        count = 0
+        for i in range(data.shape[0]):
+            # Bytes older than 64 positions shift out, so h depends only on a 64-byte window
+            h = (h << np.uint64(1)) + gear[data[i]]
+            length = i + 1 - start
+            if (length >= min_size and (h & mask) == 0) or length >= max_size:
+                out[count] = i + 1
+                count += 1
+                start = i + 1
+        if start < data.shape[0]:
+            out[count] = data.shape[0]
+            count += 1
+        return count
+else:
+    _page_diff_mask_jit = None
+    _scan_runs_jit = None
+    _cdc_cuts_jit = None
+
+_WINDOW_PAGES = 16384  # 64 MB scanned per window while the next one is read ahead
+
+# Gear hash table for content-defined chunking: one fixed pseudo-random 64-bit
+# value per byte, so chunk boundaries are stable across runs and machines
+_GEAR_TABLE = np.array([int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(),
+                                       'little') for i in range(256)], dtype=np.uint64)
+_GEAR_BLOCK = 1 << 20  # Bytes hashed per NumPy pass when numba is unavailable
+
+def _pwrite_all(fd: int, buffers: List[Any], offset: int) -> int:
+    """Write all buffers to fd at offset, gathered into a single pwritev(2) where available
+    
+    Returns the number of bytes written.
+    """
+    total = sum(len(b) for b in buffers)
+    if hasattr(os, 'pwritev'):
+        written = os.pwritev(fd, buffers, offset)
+        if written == total:
+            return total
+        remaining = memoryview(b''.join(buffers))[written:]
+    else:
+        written = 0
+        remaining = memoryview(b''.join(buffers))
+    
+    os.lseek(fd, offset + written, os.SEEK_SET)
+    while remaining:
+        remaining = remaining[os.write(fd, remaining):]
+    return total
 
 class DeltaOperation:
     ADD = 0
     MODIFY = 1
     DELETE = 2
 
-class DeltaEntry:
-    def __init__(self, base_offset: int, delta_size: int, operation: int, data: bytes = b''):
-        self.base_offset = base_offset
-        self.delta_size = delta_size
-        self.operation = operation
-        self.data = data
-        self.crc32 = zlib.crc32(data) & 0xffffffff
+# One row per delta; payloads live in a parallel list of memoryviews
+DELTA_DTYPE = np.dtype([('base_offset', '<u8'), ('delta_size', '<u8'), ('operation', '<u4'),
+                        ('crc32', '<u4')])
+
+# On-disk entry header: a delta row plus how its payload is stored
+_ENTRY_HEADER_DTYPE = np.dtype(DELTA_DTYPE.descr + [('stored_size', '<u4'), ('encoding', '<u4')])
+
+# On-disk file header, 64 bytes: chunking and checksum hold indices into the
+# trainer's CHUNKING_MODES and CHECKSUMS; target_size is the rebuilt file's length
+_FILE_HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('count', '<u4'),
+                               ('chunking', 'u1'), ('checksum', 'u1'), ('target_size', '<u8'),
+                               ('reserved', 'V42')])
+
+# Map strings per DeltaOperation value, shared by every shard entry
+_OP_NAMES = ("ADD", "MODIFY", "DELETE")
+_PRIORITY = ("high", "high", "low")
+
+def make_entries(n: int) -> np.ndarray:
+    """Allocate n zeroed delta rows"""
+    return np.zeros(n, dtype=DELTA_DTYPE)
+
+class PayloadEncoding:
+    RAW = 0
+    GROUPED = 1  # Byte-grouped, then compressed with the map's algorithm
 
 class GGUFDeltaTrainer:
     PAGE_SIZE = 4096
     DELTA_MAGIC = b'DGGF'
-    DELTA_VERSION = 1
+    DELTA_VERSION = 4
+    BYTE_GROUP_STRIDE = 4  # FP32 weights: each byte plane groups like bytes, e.g. exponents
+    COMPRESSION = 'bg4-lz4' if _lz4_block is not None else 'bg4-zlib'
+    CHUNKING_MODES = ('fixed', 'cdc')  # Header byte 12 holds the mode's index
+    CHECKSUMS = ('crc32', 'crc32c')  # Header byte 13 holds the entry checksum's index
+    CDC_MIN_SIZE = 2048
+    CDC_AVG_SIZE = 8192  # Must be a power of two
+    CDC_MAX_SIZE = 65536
+    PAYLOAD_BLOCK_SIZE = 1 << 26  # Longer runs are cut into 64 MB entries, a multiple of PAGE_SIZE
     
-    def __init__(self, base_file: str, target_file: str, output_prefix: str):
+    def __init__(self, base_file: str, target_file: str, output_prefix: str,
+                 chunking: str = 'fixed'):
+        if chunking not in self.CHUNKING_MODES:
+            raise ValueError(f"Unknown chunking mode: {chunking}")
+        
         self.base_file = Path(base_file)
         self.target_file = Path(target_file)
         self.output_prefix = output_prefix
+        self.chunking = chunking
         self.delta_file = Path(f"{output_prefix}.delta")
         self.delta_map = Path(f"{output_prefix}.sgmap")
+        self._base_fingerprints = None  # Per-page xxh3 of the base, kept in the map for reuse
+        self._fingerprint_cache = True  # Whether fingerprints from an earlier run may be reused
+        self._fingerprints_reused = False
+        self._changed_pages = None  # Page-level change mask, kept in the map as a bitmap
         
     def create_delta(self) -> bool:
         """Create delta files from base and target GGUF files"""
@@ -48,226 +223,698 @@ class GGUFDeltaTrainer:
             print(f"Creating delta from {self.base_file} -> {self.target_file}")
             
             # Load files
-            base_data = self._load_file(self.base_file)
-            target_data = self._load_file(self.target_file)
-            
-            # Find differences at page level
-            delta_entries = self._compute_page_deltas(base_data, target_data)
+            base_data = map_readonly(self.base_file)
+            target_data = map_readonly(self.target_file)
             
-            print(f"Found {len(delta_entries)} changed pages")
-            
-            # Optimize deltas
-            optimized_deltas = self._optimize_deltas(delta_entries)
+            if self.chunking == 'cdc':
+                # Find differences between content-defined chunks
+                entries, payloads = self._compute_chunk_deltas(base_data, target_data)
+            else:
+                # Find differences at page level, already coalesced into runs
+                entries, payloads = self._compute_page_deltas(base_data, target_data)
+                
+                deleted = entries['operation'] == DeltaOperation.DELETE
+                changed_pages = int(np.count_nonzero(deleted) +
+                                    entries['delta_size'][~deleted].sum() // self.PAGE_SIZE)
+                print(f"Found {changed_pages} changed pages")
             
-            print(f"Optimized to {len(optimized_deltas)} delta operations")
+            print(f"Optimized to {len(entries)} delta operations")
             
             # Write delta file
-            self._write_delta_file(optimized_deltas)
+            stored_bytes = self._write_delta_file(entries, payloads, len(target_data))
             
             # Create delta shard map
-            delta_map = self._create_delta_map(optimized_deltas)
+            delta_map = self._create_delta_map(entries, payloads, stored_bytes, len(target_data))
             self._write_delta_map(delta_map)
             
             print(f"Created {self.delta_file}")
             print(f"Created {self.delta_map}")
             
             # Verify delta integrity
-            if self._verify_delta(base_data, optimized_deltas):
+            if self._verify_delta(base_data, target_data):
                 print("Delta verification passed")
                 return True
-            else:
-                print("Delta verification failed")
-                return False
+            
+            if self._fingerprints_reused:
+                # The cached base fingerprints may be stale: diff again from
+                # scratch, which also replaces them in the map
+                print("Delta verification failed; retrying without cached fingerprints")
+                self._fingerprint_cache = False
+                return self.create_delta()
+            
+            print("Delta verification failed")
+            return False
                 
         except Exception as e:
             print(f"Error: {e}")
             return False
     
-    def _load_file(self, file_path: Path) -> bytes:
-        """Load file contents"""
-        with open(file_path, 'rb') as f:
-            return f.read()
+    def _compute_page_deltas(self, base_data: memoryview,
+                             target_data: memoryview) -> Tuple[np.ndarray, List[memoryview]]:
+        """Compute page-level differences as runs of adjacent pages; returns (entries, payloads)"""
+        # View both files as page matrices; only a partial last page is copied (padded)
+        base_pages, base_tail = self._page_matrix(base_data)
+        target_pages, target_tail = self._page_matrix(target_data)
+        base_count = len(base_pages) + len(base_tail)
+        target_count = len(target_pages) + len(target_tail)
+        
+        common_pages = min(base_count, target_count)
+        cached = None
+        if _xxh3_64 is not None and self._fingerprint_cache:
+            cached = self._load_base_fingerprints(base_count)
+        self._fingerprints_reused = cached is not None
+        if cached is not None:
+            # Fingerprints from the previous run's map describe the base, so
+            # only the target is read: pages whose fingerprints differ have changed
+            self._base_fingerprints = cached
+            target_fingerprints = np.concatenate(
+                [self._page_fingerprints(target_pages[:common_pages], target_data),
+                 self._page_fingerprints(target_tail)])[:common_pages]
+            starts, ends = self._mask_runs(cached[:common_pages] != target_fingerprints)
+        else:
+            # Compare every whole page both files share, window by window
+            whole_pages = min(len(base_pages), len(target_pages), common_pages)
+            if _xxh3_64 is not None:
+                self._base_fingerprints = np.empty(base_count, dtype=np.uint64)
+            starts, ends = [], []
+            for start, end in self._prefetched_windows(whole_pages, base_data, target_data):
+                window_starts, window_ends = self._changed_runs(base_pages[start:end],
+                                                                target_pages[start:end])
+                if window_starts and window_starts[0] == 0 and ends and ends[-1] == start:
+                    # The last run continues across the window edge
+                    window_starts.pop(0)
+                    ends[-1] = start + window_ends.pop(0)
+                starts += [start + page for page in window_starts]
+                ends += [start + page for page in window_ends]
+                if _xxh3_64 is not None:
+                    # Fingerprint the base window while it is still resident, so
+                    # the next delta against this base need not read it
+                    self._base_fingerprints[start:end] = \
+                        self._page_fingerprints(base_pages[start:end])
+            if _xxh3_64 is not None:
+                # Base pages the windows did not cover: partial or past the target
+                self._base_fingerprints[whole_pages:] = np.concatenate(
+                    [self._page_fingerprints(base_pages[whole_pages:]),
+                     self._page_fingerprints(base_tail)])
+            if common_pages > whole_pages:
+                # The last shared page is partial in at least one file
+                base_last = (base_tail[0] if whole_pages == len(base_pages)
+                             else base_pages[whole_pages])
+                target_last = (target_tail[0] if whole_pages == len(target_pages)
+                               else target_pages[whole_pages])
+                if not np.array_equal(base_last, target_last):
+                    if ends and ends[-1] == whole_pages:
+                        ends[-1] += 1
+                    else:
+                        starts.append(whole_pages)
+                        ends.append(whole_pages + 1)
+        
+        # Every page in a run, or present in only one of the files, has changed
+        edges = np.zeros(max(base_count, target_count) + 1, dtype=np.int8)
+        edges[starts] = 1
+        edges[ends] -= 1
+        self._changed_pages = np.cumsum(edges[:-1]) > 0
+        self._changed_pages[common_pages:] = True
+        
+        # Modified runs, then pages past the end of the base as one added run
+        starts, ends = self._block_ranges([start * self.PAGE_SIZE for start in starts],
+                                          [end * self.PAGE_SIZE for end in ends])
+        modified = len(starts)
+        if target_count > common_pages:
+            added_starts, added_ends = self._block_ranges([common_pages * self.PAGE_SIZE],
+                                                          [target_count * self.PAGE_SIZE])
+            starts += added_starts
+            ends += added_ends
+        
+        deleted_pages = np.arange(common_pages, base_count, dtype=np.uint64)
+        
+        entries = make_entries(len(starts) + len(deleted_pages))
+        entries['base_offset'][:len(starts)] = starts
+        entries['delta_size'][:len(starts)] = np.subtract(ends, starts)
+        entries['operation'][:modified] = DeltaOperation.MODIFY
+        entries['operation'][modified:len(starts)] = DeltaOperation.ADD
+        # Deleted pages carry no payload (and so the CRC of nothing, 0)
+        entries['base_offset'][len(starts):] = deleted_pages * self.PAGE_SIZE
+        entries['operation'][len(starts):] = DeltaOperation.DELETE
+        
+        # Payloads are slices of the mapped target, except that the block ending
+        # in the partial last page is copied to append its padding
+        payloads = [target_data[start:end] if end <= len(target_data)
+                    else memoryview(bytes(target_data[start:]) + bytes(end - len(target_data)))
+                    for start, end in zip(starts, ends)]
+        entries['crc32'][:len(starts)] = [_checksum(payload) for payload in payloads]
+        payloads += [memoryview(b'')] * len(deleted_pages)
+        
+        return entries, payloads
+    
+    def _page_fingerprints(self, pages: np.ndarray, *views: memoryview) -> np.ndarray:
+        """xxh3-64 fingerprint of every page of a page matrix, reading ahead in views"""
+        return np.fromiter((_xxh3_64(page)
+                            for start, end in self._prefetched_windows(len(pages), *views)
+                            for page in pages[start:end]), dtype=np.uint64, count=len(pages))
+    
+    def _prefetched_windows(self, page_count: int, *views: memoryview):
+        """Yield [start, end) windows over page_count pages, reading the next one ahead
+        
+        Before a window is yielded, the kernel is asked to start reading the
+        following window of each mapped view, so disk reads proceed in the
+        background while the caller works through the current window.
+        """
+        maps = [view.obj for view in views if isinstance(view.obj, mmap.mmap)]
+        if not hasattr(mmap, 'MADV_WILLNEED'):
+            maps = []
+        
+        window_bytes = _WINDOW_PAGES * self.PAGE_SIZE
+        for start in range(0, page_count, _WINDOW_PAGES):
+            ahead = (start + _WINDOW_PAGES) * self.PAGE_SIZE
+            for mm in maps:
+                if ahead < len(mm):
+                    # Window edges are multiples of 64 MB, so always system-page aligned
+                    mm.madvise(mmap.MADV_WILLNEED, ahead, min(window_bytes, len(mm) - ahead))
+            yield start, min(start + _WINDOW_PAGES, page_count)
+    
+    def _load_base_fingerprints(self, page_count: int) -> Optional[np.ndarray]:
+        """Base page fingerprints stored in an existing map, if they still describe the base file"""
+        try:
+            cached = read_json(self.delta_map)["base_fingerprints"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        
+        identity = self._base_identity()
+        if cached.get("algorithm") != "xxh3_64" or any(cached.get(key) != value
+                                                       for key, value in identity.items()):
+            return None
+        
+        fingerprints = np.frombuffer(base64.b64decode(cached["data"]), dtype='<u8')
+        return fingerprints.astype(np.uint64) if len(fingerprints) == page_count else None
+    
+    def _base_identity(self) -> Dict[str, Any]:
+        """What stored fingerprints must match to still describe the base file
+        
+        Size and mtime alone are shared by copies made with cp -p or unpacked
+        from archives with normalized times, so the file's path and inode count too.
+        """
+        stat = self.base_file.stat()
+        return {
+            "path": str(self.base_file.resolve()),
+            "device": stat.st_dev,
+            "inode": stat.st_ino,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns
+        }
+    
+    def _compute_chunk_deltas(self, base_data: memoryview,
+                              target_data: memoryview) -> Tuple[np.ndarray, List[memoryview]]:
+        """Compute differences between content-defined chunks of the two files
+        
+        Chunk boundaries follow content rather than fixed offsets, so bytes
+        inserted or removed only disturb the chunks around the edit. Entries are
+        edits in target coordinates, applied in offset order: a DELETE removes
+        delta_size bytes of base content and an ADD inserts target bytes.
+        Returns (entries, payloads).
+        """
+        rows = []
+        payloads = []
+        
+        base_bounds = self._chunk_boundaries(base_data)
+        target_bounds = self._chunk_boundaries(target_data)
+        
+        # Align the two chunk sequences by fingerprint; matching chunks cost nothing
+        base_chunks = self._chunk_fingerprints(base_data, base_bounds)
+        target_chunks = self._chunk_fingerprints(target_data, target_bounds)
+        for i1, i2, j1, j2 in self._unmatched_chunks(base_chunks, target_chunks):
+            offset = target_bounds[j1]
+            base_size = base_bounds[i2] - base_bounds[i1]
+            target_size = target_bounds[j2] - offset
+            
+            if base_size == target_size:
+                # Chunks replaced in place
+                operation = DeltaOperation.MODIFY
+            else:
+                if base_size:
+                    # Base chunks removed
+                    rows.append((offset, base_size, DeltaOperation.DELETE))
+                    payloads.append(memoryview(b''))
+                # Target chunks inserted
+                operation = DeltaOperation.ADD
+            
+            for start, end in zip(*self._block_ranges([offset], [offset + target_size])):
+                rows.append((start, end - start, operation))
+                payloads.append(target_data[start:end])
+        
+        entries = make_entries(len(rows))
+        if rows:
+            entries['base_offset'], entries['delta_size'], entries['operation'] = zip(*rows)
+            entries['crc32'] = [_checksum(payload) for payload in payloads]
+        
+        return entries, payloads
+    
+    def _block_ranges(self, starts: List[int], ends: List[int]) -> Tuple[List[int], List[int]]:
+        """Cut byte ranges [start, end) into blocks of at most PAYLOAD_BLOCK_SIZE bytes
+        
+        Each block becomes its own entry, so payloads are encoded in bounded
+        memory and their stored sizes fit the entry header's 32 bits.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        blocks = -(-(ends - starts) // self.PAYLOAD_BLOCK_SIZE)
+        
+        # Block k of a run starts k * PAYLOAD_BLOCK_SIZE bytes into it
+        index = np.arange(blocks.sum()) - np.repeat(np.cumsum(blocks) - blocks, blocks)
+        block_starts = np.repeat(starts, blocks) + index * self.PAYLOAD_BLOCK_SIZE
+        block_ends = np.minimum(block_starts + self.PAYLOAD_BLOCK_SIZE, np.repeat(ends, blocks))
+        return block_starts.tolist(), block_ends.tolist()
     
-    def _compute_page_deltas(self, base_data: bytes, target_data: bytes) -> List[DeltaEntry]:
-        """Compute page-level differences"""
-        deltas = []
+    def _unmatched_chunks(self, a: List[bytes], b: List[bytes]):
+        """Yield the (i1, i2, j1, j2) spans of a and b left unmatched by a monotone alignment
         
-        # Pad to page boundaries
-        base_pages = self._split_to_pages(base_data)
-        target_pages = self._split_to_pages(target_data)
+        Runs in linear time. The common prefix and suffix match first. In
+        between, fingerprints occurring exactly once in each list are anchors,
+        taken greedily in target order while both sides keep increasing, and
+        each anchor grows over equal neighbours in both directions. Repeated
+        chunks (zero padding cut at the maximum size) thus match by extension
+        rather than being compared against each other.
+        """
+        a_end, b_end = len(a), len(b)
+        prefix = 0
+        while prefix < min(a_end, b_end) and a[prefix] == b[prefix]:
+            prefix += 1
+        while a_end > prefix and b_end > prefix and a[a_end - 1] == b[b_end - 1]:
+            a_end -= 1
+            b_end -= 1
         
-        max_pages = max(len(base_pages), len(target_pages))
+        a_counts = {}
+        for fingerprint in a[prefix:a_end]:
+            a_counts[fingerprint] = a_counts.get(fingerprint, 0) + 1
+        b_counts = {}
+        for fingerprint in b[prefix:b_end]:
+            b_counts[fingerprint] = b_counts.get(fingerprint, 0) + 1
+        a_unique = {a[i]: i for i in range(prefix, a_end) if a_counts[a[i]] == 1}
         
-        for i in range(max_pages):
-            base_page = base_pages[i] if i < len(base_pages) else b''
-            target_page = target_pages[i] if i < len(target_pages) else b''
+        # Matched so far: a[:i_done] with b[:j_done]
+        i_done = j_done = prefix
+        for j in range(prefix, b_end):
+            i = a_unique.get(b[j]) if b_counts[b[j]] == 1 else None
+            if i is None or i < i_done or j < j_done:
+                # Not an anchor, out of order, or already covered by an extension
+                continue
+            
+            i_start, j_start = i, j
+            while i_start > i_done and j_start > j_done and a[i_start - 1] == b[j_start - 1]:
+                i_start -= 1
+                j_start -= 1
+            if i_start > i_done or j_start > j_done:
+                yield i_done, i_start, j_done, j_start
             
-            offset = i * self.PAGE_SIZE
+            i_done, j_done = i + 1, j + 1
+            while i_done < a_end and j_done < b_end and a[i_done] == b[j_done]:
+                i_done += 1
+                j_done += 1
+        
+        if i_done < a_end or j_done < b_end:
+            yield i_done, a_end, j_done, b_end
+    
+    def _chunk_boundaries(self, data: memoryview) -> List[int]:
+        """Split data into content-defined chunks; returns their boundary offsets, starting at 0"""
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        avg_bits = self.CDC_AVG_SIZE.bit_length() - 1
+        # Cut where the top bits of the gear hash are zero: the low bits only see the last few bytes
+        mask = ((1 << avg_bits) - 1) << (64 - avg_bits)
+        
+        if _cdc_cuts_jit is not None:
+            cuts = np.empty(len(buffer) // self.CDC_MIN_SIZE + 1, dtype=np.int64)
+            count = _cdc_cuts_jit(buffer, _GEAR_TABLE, np.uint64(mask), self.CDC_MIN_SIZE,
+                                  self.CDC_MAX_SIZE, cuts)
+            return [0] + cuts[:count].tolist()
+        
+        bounds = [0]
+        start = 0
+        for end in self._gear_candidates(buffer, mask):
+            while end - start > self.CDC_MAX_SIZE:
+                start += self.CDC_MAX_SIZE
+                bounds.append(start)
+            if end - start >= self.CDC_MIN_SIZE:
+                bounds.append(end)
+                start = end
+        
+        while len(buffer) - start > self.CDC_MAX_SIZE:
+            start += self.CDC_MAX_SIZE
+            bounds.append(start)
+        if start < len(buffer):
+            bounds.append(len(buffer))
+        return bounds
+    
+    def _gear_candidates(self, buffer: np.ndarray, mask: int):
+        """Yield every offset where a chunk may end, block by block
+        
+        The gear hash after byte i is the sum of gear[byte i - k] << k over the
+        last 64 bytes. Doubling the window (1, 2, 4, ... 64 bytes) gets there in
+        six vector passes per block.
+        """
+        mask = np.uint64(mask)
+        for block_start in range(0, len(buffer), _GEAR_BLOCK):
+            block_end = min(block_start + _GEAR_BLOCK, len(buffer))
+            history = min(block_start, 63)
+            h = _GEAR_TABLE[buffer[block_start - history:block_end]]
             
-            if not base_page and target_page:
-                # New page added
-                deltas.append(DeltaEntry(offset, len(target_page), DeltaOperation.ADD, target_page))
-            elif base_page and not target_page:
-                # Page deleted
-                deltas.append(DeltaEntry(offset, 0, DeltaOperation.DELETE))
-            elif base_page != target_page:
-                # Page modified
-                deltas.append(DeltaEntry(offset, len(target_page), DeltaOperation.MODIFY, target_page))
-        
-        return deltas
-    
-    def _split_to_pages(self, data: bytes) -> List[bytes]:
-        """Split data into 4KB pages"""
-        pages = []
-        for i in range(0, len(data), self.PAGE_SIZE):
-            page = data[i:i + self.PAGE_SIZE]
-            # Pad last page if needed
-            if len(page) < self.PAGE_SIZE:
-                page += b'\x00' * (self.PAGE_SIZE - len(page))
-            pages.append(page)
-        return pages
-    
-    def _optimize_deltas(self, deltas: List[DeltaEntry]) -> List[DeltaEntry]:
-        """Optimize delta operations"""
-        if not deltas:
-            return []
-        
-        optimized = []
-        current_run = [deltas[0]]
-        
-        for i in range(1, len(deltas)):
-            current = deltas[i]
-            previous = current_run[-1]
+            span = 1
+            while span < 64:
+                h[span:] += h[:-span] << np.uint64(span)
+                span *= 2
             
-            # Check if we can merge consecutive operations
-            if (current.operation == previous.operation and 
-                current.operation in [DeltaOperation.ADD, DeltaOperation.MODIFY] and
-                current.base_offset == previous.base_offset + previous.delta_size):
+            yield from (np.flatnonzero((h[history:] & mask) == 0) + block_start + 1).tolist()
+    
+    def _chunk_fingerprints(self, data: memoryview, bounds: List[int]) -> List[bytes]:
+        """Fingerprint each chunk by a 128-bit hash of its bytes"""
+        return [hashlib.blake2b(data[start:end], digest_size=16).digest()
+                for start, end in zip(bounds, bounds[1:])]
+    
+    def _changed_runs(self, base_pages: np.ndarray,
+                      target_pages: np.ndarray) -> Tuple[List[int], List[int]]:
+        """Find the runs of pages that differ between two equally long page matrices
+        
+        Returns the [start, end) page indices of each run as two lists.
+        """
+        # Compare 8 bytes at a time: 512 words per page rather than 4096 bytes
+        base_pages = base_pages.view(np.uint64)
+        target_pages = target_pages.view(np.uint64)
+        
+        # The kernels are compiled for 4KB pages only
+        jit = _scan_runs_jit is not None and base_pages.shape[1] == _PAGE_WORDS
+        
+        if jit and parallel_jit_allowed(len(base_pages)):
+            changed = np.empty(len(base_pages), dtype=np.bool_)
+            _page_diff_mask_jit(base_pages, target_pages, changed)
+            return self._mask_runs(changed)
+        
+        if jit:
+            # Serial kernel: compares and collects runs in one pass, with no
+            # thread startup or intermediate mask
+            starts = np.empty((len(base_pages) + 1) // 2, dtype=np.int64)
+            ends = np.empty_like(starts)
+            runs = _scan_runs_jit(base_pages, target_pages, starts, ends)
+            return starts[:runs].tolist(), ends[:runs].tolist()
+        
+        return self._mask_runs(np.any(base_pages != target_pages, axis=1))
+    
+    def _mask_runs(self, changed: np.ndarray) -> Tuple[List[int], List[int]]:
+        """Split a changed-page mask into the [start, end) page indices of its runs"""
+        # Edges of the mask pair up as the start and end of each run
+        edges = np.flatnonzero(np.diff(np.r_[0, changed.view(np.int8), 0]))
+        return edges[0::2].tolist(), edges[1::2].tolist()
+    
+    def _page_matrix(self, data: memoryview) -> Tuple[np.ndarray, np.ndarray]:
+        """View data as rows of 4KB pages; returns (whole pages, partial last page)
+        
+        Whole pages are a zero-copy view of data. The partial last page, if any,
+        is a zero-padded copy in a one-row matrix; otherwise that matrix is empty.
+        """
+        data = np.frombuffer(data, dtype=np.uint8)
+        whole_size = len(data) - len(data) % self.PAGE_SIZE
+        tail = np.zeros((1 if whole_size < len(data) else 0, self.PAGE_SIZE), dtype=np.uint8)
+        if len(tail):
+            tail[0, :len(data) - whole_size] = data[whole_size:]
+        return data[:whole_size].reshape(-1, self.PAGE_SIZE), tail
+    
+    def _write_delta_file(self, entries: np.ndarray, payloads: List[memoryview],
+                          target_size: int) -> int:
+        """Write delta file; returns the number of payload bytes stored"""
+        # Entry headers are rows of one array, so each is a slice of its buffer
+        headers = np.zeros(len(entries), dtype=_ENTRY_HEADER_DTYPE)
+        for name in DELTA_DTYPE.names:
+            headers[name] = entries[name]
+        header_rows = headers.view(np.uint8).reshape(len(entries), _ENTRY_HEADER_DTYPE.itemsize)
+        
+        stored_bytes = 0
+        batch_size = (IOV_MAX - 1) // 2
+        
+        with open(self.delta_file, 'wb', buffering=0) as f:
+            # Payloads are never stored larger than raw, which bounds the file size
+            preallocate(f.fileno(),
+                        _FILE_HEADER_DTYPE.itemsize + headers.nbytes + sum(map(len, payloads)))
+            
+            # Write header; the reserved space stays zeroed
+            header = np.zeros(1, dtype=_FILE_HEADER_DTYPE)
+            header['magic'] = self.DELTA_MAGIC
+            header['version'] = self.DELTA_VERSION
+            header['count'] = len(entries)
+            header['chunking'] = self.CHUNKING_MODES.index(self.chunking)
+            header['checksum'] = self.CHECKSUMS.index(_CHECKSUM)
+            header['target_size'] = target_size
+            buffers = [header.view(np.uint8)]
+            offset = 0
+            
+            # Write delta entries; the CRC covers the payload before encoding.
+            # Entries are gathered so each pwritev(2) carries up to IOV_MAX buffers
+            for first in range(0, len(entries), batch_size):
+                batch = range(first, min(first + batch_size, len(entries)))
+                encoded = [self._encode_payload(payloads[i]) for i in batch]
                 
-                # Merge into current run
-                current_run.append(current)
-            else:
-                # End current run and start new one
-                if len(current_run) > 1:
-                    # Merge run into single delta
-                    merged = self._merge_delta_run(current_run)
-                    optimized.append(merged)
-                else:
-                    optimized.append(current_run[0])
+                stored_sizes = [len(payload) for payload, _ in encoded]
+                if max(stored_sizes) > 0xFFFFFFFF:
+                    raise ValueError("Delta payload too large for its entry header")
+                headers['stored_size'][batch.start:batch.stop] = stored_sizes
+                headers['encoding'][batch.start:batch.stop] = [encoding for _, encoding in encoded]
+                stored_bytes += sum(stored_sizes)
                 
-                current_run = [current]
+                for i, (payload, _) in zip(batch, encoded):
+                    buffers.append(header_rows[i])
+                    buffers.append(payload)
+                offset += _pwrite_all(f.fileno(), buffers, offset)
+                buffers = []
+            
+            if buffers:
+                offset += _pwrite_all(f.fileno(), buffers, offset)
+            
+            # Give back the reservation that compression left unused
+            os.ftruncate(f.fileno(), offset)
         
-        # Handle final run
-        if len(current_run) > 1:
-            merged = self._merge_delta_run(current_run)
-            optimized.append(merged)
+        return stored_bytes
+    
+    def _encode_payload(self, data: memoryview):
+        """Byte-group and compress a delta payload; returns (stored bytes, PayloadEncoding)
+        
+        Payloads that would not shrink are stored raw.
+        """
+        if not len(data):
+            return data, PayloadEncoding.RAW
+        
+        # Transpose stride-sized words into byte planes, leaving any tail as is;
+        # one copy, straight into the buffer that is compressed
+        raw = np.frombuffer(data, dtype=np.uint8)
+        grouped_size = len(raw) - len(raw) % self.BYTE_GROUP_STRIDE
+        grouped = np.empty_like(raw)
+        grouped[:grouped_size].reshape(self.BYTE_GROUP_STRIDE, -1)[:] = \
+            raw[:grouped_size].reshape(-1, self.BYTE_GROUP_STRIDE).T
+        grouped[grouped_size:] = raw[grouped_size:]
+        
+        if _lz4_block is not None:
+            packed = _lz4_block.compress(grouped, store_size=False)
         else:
-            optimized.append(current_run[0])
-        
-        return optimized
-    
-    def _merge_delta_run(self, run: List[DeltaEntry]) -> DeltaEntry:
-        """Merge consecutive delta entries"""
-        if not run:
-            raise ValueError("Empty run")
-        
-        first = run[0]
-        merged_data = b''.join(entry.data for entry in run)
-        
-        return DeltaEntry(
-            first.base_offset,
-            len(merged_data),
-            first.operation,
-            merged_data
-        )
-    
-    def _write_delta_file(self, deltas: List[DeltaEntry]) -> None:
-        """Write delta file"""
-        with open(self.delta_file, 'wb') as f:
-            # Write header
-            header = struct.pack('<4sII', self.DELTA_MAGIC, self.DELTA_VERSION, len(deltas))
-            header += b'\x00' * 52  # Reserved space
-            f.write(header)
-            
-            # Write delta entries
-            for delta in deltas:
-                entry_header = struct.pack('<QQII', 
-                    delta.base_offset,
-                    delta.delta_size,
-                    delta.operation,
-                    delta.crc32
-                )
-                f.write(entry_header)
-                f.write(delta.data)
-    
-    def _create_delta_map(self, deltas: List[DeltaEntry]) -> Dict[str, Any]:
-        """Create delta shard map"""
-        delta_shards = []
+            packed = zlib.compress(grouped, 1)
+        
+        if len(packed) >= len(data):
+            return data, PayloadEncoding.RAW
+        return packed, PayloadEncoding.GROUPED
+    
+    def _decode_payload(self, stored: memoryview, encoding: int, size: int) -> memoryview:
+        """Undo _encode_payload: the size payload bytes a stored payload holds"""
+        if encoding == PayloadEncoding.RAW:
+            return stored
+        if encoding != PayloadEncoding.GROUPED:
+            raise ValueError(f"Unknown payload encoding: {encoding}")
         
-        for i, delta in enumerate(deltas):
-            shard = {
+        if _lz4_block is not None:
+            grouped = _lz4_block.decompress(stored, uncompressed_size=size)
+        else:
+            grouped = zlib.decompress(stored)
+        grouped = np.frombuffer(grouped, dtype=np.uint8)
+        if len(grouped) != size:
+            raise ValueError("Decoded payload has the wrong size")
+        
+        # Interleave the byte planes back into stride-sized words
+        grouped_size = size - size % self.BYTE_GROUP_STRIDE
+        data = np.empty_like(grouped)
+        data[:grouped_size].reshape(-1, self.BYTE_GROUP_STRIDE)[:] = \
+            grouped[:grouped_size].reshape(self.BYTE_GROUP_STRIDE, -1).T
+        data[grouped_size:] = grouped[grouped_size:]
+        return memoryview(data)
+    
+    def _create_delta_map(self, entries: np.ndarray, payloads: List[memoryview], stored_bytes: int,
+                          target_size: int) -> Dict[str, Any]:
+        """Create delta shard map"""
+        delta_shards = [
+            {
                 "id": i,
-                "base_offset": delta.base_offset,
-                "delta_size": delta.delta_size,
-                "operation": ["ADD", "MODIFY", "DELETE"][delta.operation],
-                "crc32": f"0x{delta.crc32:08x}",
-                "priority": "high" if delta.operation != DeltaOperation.DELETE else "low"
+                "base_offset": base_offset,
+                "delta_size": delta_size,
+                "operation": _OP_NAMES[operation],
+                "checksum": checksum,  # Of the map's checksum algorithm
+                "priority": _PRIORITY[operation]
             }
-            delta_shards.append(shard)
+            for i, (base_offset, delta_size, operation, checksum) in enumerate(entries.tolist())
+        ]
         
-        return {
-            "version": "1.0",
+        delta_map = {
+            "version": "2.1",
             "type": "delta",
             "base_file": str(self.base_file.name),
             "target_file": str(self.target_file.name),
-            "total_deltas": len(deltas),
+            "target_size": target_size,  # Rebuilt files are cut to this size
+            "total_deltas": len(entries),
             "page_size": self.PAGE_SIZE,
+            "chunking": self.chunking,
+            "checksum": _CHECKSUM,
             "deltas": delta_shards,
             "compression": {
-                "algorithm": "none",
-                "ratio": 1.0
+                "algorithm": self.COMPRESSION,
+                "ratio": round(sum(map(len, payloads)) / stored_bytes, 3) if stored_bytes else 1.0
             }
         }
+        
+        if self._changed_pages is not None:
+            # One bit per page, first page in the high bit of the first byte
+            delta_map["changed_pages"] = {
+                "count": len(self._changed_pages),
+                "bitmap": base64.b64encode(np.packbits(self._changed_pages).tobytes())
+                                .decode('ascii')
+            }
+        
+        if self._base_fingerprints is not None:
+            # Lets the next delta against this base skip hashing it
+            delta_map["base_fingerprints"] = {
+                "algorithm": "xxh3_64",
+                **self._base_identity(),
+                "data": base64.b64encode(self._base_fingerprints.astype('<u8').tobytes())
+                              .decode('ascii')
+            }
+        
+        return delta_map
     
     def _write_delta_map(self, delta_map: Dict[str, Any]) -> None:
         """Write delta shard map"""
-        with open(self.delta_map, 'w') as f:
-            json.dump(delta_map, f, indent=2)
+        write_json(self.delta_map, delta_map)
     
-    def _verify_delta(self, base_data: bytes, deltas: List[DeltaEntry]) -> bool:
-        """Verify delta can be applied correctly"""
+    def _verify_delta(self, base_data: memoryview, target_data: memoryview) -> bool:
+        """Verify the delta file as written rebuilds the target from the base
+        
+        Every payload is read back, decoded and checked against its entry's
+        checksum. The rebuilt file is streamed through a CRC32 rather than
+        materialized, cut at the target size the delta file records, and
+        compared with the target's CRC.
+        """
         try:
-            # Apply deltas to base data
-            result_data = bytearray(base_data)
+            target_size, entries, stored = self._read_delta_file(map_readonly(self.delta_file))
+            if target_size != len(target_data):
+                raise ValueError("Delta file records the wrong target size")
+            
+            offsets = entries['base_offset']
+            if np.any(offsets[1:] < offsets[:-1]):
+                # Both diffs emit entries already sorted, so this is only a safeguard
+                order = np.argsort(offsets, kind='stable')
+                entries = entries[order]
+                stored = [stored[i] for i in order.tolist()]
             
-            for delta in sorted(deltas, key=lambda d: d.base_offset):
-                if delta.operation == DeltaOperation.ADD:
-                    # Insert data
-                    result_data[delta.base_offset:delta.base_offset] = delta.data
-                elif delta.operation == DeltaOperation.MODIFY:
-                    # Replace data
-                    end_offset = delta.base_offset + delta.delta_size
-                    result_data[delta.base_offset:end_offset] = delta.data
-                elif delta.operation == DeltaOperation.DELETE:
-                    # Remove data
-                    end_offset = delta.base_offset + delta.delta_size
-                    del result_data[delta.base_offset:end_offset]
+            crc = 0
+            remaining = target_size
             
-            # Compare with target (simplified verification)
-            target_data = self._load_file(self.target_file)
+            payloads = self._decoded_payloads(entries, stored)
+            for piece in self._rebuilt_pieces(base_data, entries, payloads, target_size):
+                piece = piece[:remaining]
+                crc = _checksum(piece, crc)
+                remaining -= len(piece)
             
-            # For now, just verify the deltas don't corrupt the basic structure
-            return len(result_data) > 0 and len(deltas) > 0
+            return remaining == 0 and crc == _checksum(target_data)
             
         except Exception as e:
             print(f"Verification error: {e}")
             return False
+    
+    def _read_delta_file(self, data: memoryview) -> Tuple[int, np.ndarray, List[memoryview]]:
+        """Parse a delta file; returns (target size, entry headers, stored payloads)
+        
+        Stored payloads are slices of data, still encoded.
+        """
+        header = np.frombuffer(data, dtype=_FILE_HEADER_DTYPE, count=1)[0]
+        if header['magic'] != self.DELTA_MAGIC or header['version'] != self.DELTA_VERSION:
+            raise ValueError("Not a delta file of this version")
+        
+        entries = np.empty(int(header['count']), dtype=_ENTRY_HEADER_DTYPE)
+        stored = []
+        offset = _FILE_HEADER_DTYPE.itemsize
+        for i in range(len(entries)):
+            entries[i] = np.frombuffer(data, dtype=_ENTRY_HEADER_DTYPE, count=1, offset=offset)[0]
+            offset += _ENTRY_HEADER_DTYPE.itemsize
+            stored.append(data[offset:offset + int(entries['stored_size'][i])])
+            offset += len(stored[-1])
+        
+        if offset != len(data):
+            raise ValueError("Delta file size does not match its entries")
+        return int(header['target_size']), entries, stored
+    
+    def _decoded_payloads(self, entries: np.ndarray, stored: List[memoryview]):
+        """Decode stored payloads one at a time, checking each against its entry's checksum"""
+        for i, (payload, encoding, size, crc) in enumerate(zip(stored, entries['encoding'].tolist(),
+                                                               entries['delta_size'].tolist(),
+                                                               entries['crc32'].tolist())):
+            payload = self._decode_payload(payload, encoding, size)
+            if _checksum(payload) != crc:
+                raise ValueError(f"Delta entry {i} fails its checksum")
+            yield payload
+    
+    def _rebuilt_pieces(self, base_data: memoryview, entries: np.ndarray,
+                        payloads: Iterable[memoryview], target_size: int):
+        """Yield, in order, the pieces of the file the deltas rebuild from base_data
+        
+        Deltas are applied in offset order, offsets counting bytes already
+        rebuilt. The base reads as zero-padded past its end, as pages do, at
+        least up to target_size; callers cut the pieces at target_size.
+        """
+        rebuilt = 0
+        base_offset = 0
+        
+        for offset, delta_size, operation, payload in zip(entries['base_offset'].tolist(),
+                                                          entries['delta_size'].tolist(),
+                                                          entries['operation'].tolist(), payloads):
+            # Unchanged base bytes up to the delta
+            gap = offset - rebuilt
+            if gap > 0:
+                unchanged = base_data[base_offset:base_offset + gap]
+                yield unchanged
+                if len(unchanged) < gap:
+                    yield bytes(gap - len(unchanged))
+                base_offset += gap
+                rebuilt += gap
+            
+            if operation == DeltaOperation.ADD:
+                # Insert data
+                yield payload
+                rebuilt += len(payload)
+            elif operation == DeltaOperation.MODIFY:
+                # Replace data
+                yield payload
+                rebuilt += len(payload)
+                base_offset += delta_size
+            elif operation == DeltaOperation.DELETE:
+                # Remove data
+                base_offset += delta_size
+        
+        yield base_data[base_offset:]
+        
+        # A target that grew only by zeros inside the base's last page matches
+        # that page once padded, so no delta covers its end
+        shortfall = target_size - rebuilt - max(len(base_data) - base_offset, 0)
+        if shortfall > 0:
+            yield bytes(shortfall)
 
 def main():
     parser = argparse.ArgumentParser(description='Create delta updates for GGUF files')
     parser.add_argument('--base', required=True, help='Base GGUF file')
     parser.add_argument('--target', required=True, help='Target GGUF file')
     parser.add_argument('--output', required=True, help='Output prefix for delta files')
+    parser.add_argument('--chunking', choices=GGUFDeltaTrainer.CHUNKING_MODES, default='fixed',
+                        help='Diff fixed 4KB pages, or content-defined chunks that tolerate '
+                             'inserted bytes')
     
     args = parser.parse_args()
     
@@ -279,7 +926,7 @@ def main():
         print(f"Error: Target file {args.target} not found")
         sys.exit(1)
     
-    trainer = GGUFDeltaTrainer(args.base, args.target, args.output)
+    trainer = GGUFDeltaTrainer(args.base, args.target, args.output, args.chunking)
     success = trainer.create_delta()
     
     sys.exit(0 if success else 1)